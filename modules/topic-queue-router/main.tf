@@ -254,6 +254,7 @@ resource "aws_lambda_function" "router" {
       LARGE_QUEUE_URL   = aws_sqs_queue.products["large"].url
       POWERTOOLS_SERVICE_NAME = "topic-queue-router"
       POWERTOOLS_LOG_LEVEL    = var.log_level
+      EMIT_MESSAGE_ATTRS      = tostring(var.emit_message_attributes)
     }
   }
   
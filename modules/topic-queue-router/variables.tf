@@ -59,4 +59,10 @@ variable "use_aws_managed_msk_policy" {
   description = "Use AWS managed AWSLambdaMSKExecutionRole policy instead of custom policy"
   type        = bool
   default     = false
+}
+
+variable "emit_message_attributes" {
+  description = "Attach queueType and productId as SQS message attributes (values are always present in the message body)"
+  type        = bool
+  default     = false
 }
\ No newline at end of file
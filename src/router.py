@@ -5,23 +5,73 @@ This Lambda function consumes messages from MSK and routes them to appropriate
 SQS queues based on queue type metadata from ProductApplicationsCountTransform.
 """
 
+import atexit
 import json
 import os
-import base64
-import boto3
-from typing import Dict, List, Any, Optional
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import binascii
+import boto3  # type: ignore[import-untyped]
+from botocore.config import Config  # type: ignore[import-untyped]
+from typing import Dict, List, Any, Optional, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 import logging
+from collections import defaultdict
+from functools import partial
 from aws_lambda_powertools import Logger, Tracer, Metrics
 from aws_lambda_powertools.metrics import MetricUnit
 
+# Equivalent to base64.b64decode without its Python-level argument wrapper
+_b64decode = binascii.a2b_base64
+
 # Initialize AWS Lambda Powertools
 logger = Logger()
 tracer = Tracer()
 metrics = Metrics()
 
-# Initialize SQS client (reused across invocations)
-sqs_client = boto3.client('sqs')
+# orjson is a native extension and must be packaged for the Lambda platform
+# (see modules/topic-queue-router/README.md). Note that it parses integers
+# wider than 64 bits as floats, where stdlib json keeps them exact.
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+
+    def _json_dumps(obj: Any) -> str:
+        # SQS MessageBody must be a str; orjson always emits UTF-8 bytes
+        return orjson.dumps(obj).decode('utf-8')
+except ImportError:  # pragma: no cover - fallback when orjson is unavailable
+    logger.warning("orjson is not available for this platform; falling back to stdlib json")
+    _json_loads = json.loads  # type: ignore[assignment]
+    _json_dumps = json.dumps
+
+# Performance configuration
+# Concurrent SQS operations; defaults to a multiple of the vCPUs Lambda
+# allocates for the configured memory size, capped to avoid oversubscription
+MAX_WORKERS = int(os.environ.get('MAX_WORKERS', min(32, (os.cpu_count() or 1) * 4)))
+BATCH_SIZE = 10   # SQS batch send size
+
+# queueType/productId are already in the message body; only attach them as
+# SQS message attributes when a consumer needs them for filtering
+EMIT_MESSAGE_ATTRS = os.environ.get('EMIT_MESSAGE_ATTRS', 'false').lower() == 'true'
+
+# SQS client configuration. Each worker holds at most one connection, so the
+# pool matches MAX_WORKERS; TCP keepalive keeps pooled connections warm
+# between warm invocations.
+SQS_CLIENT_CONFIG = Config(
+    max_pool_connections=MAX_WORKERS,
+    retries={'mode': 'standard', 'max_attempts': 3},
+    tcp_keepalive=True
+)
+
+# SQS client, created on first send and reused across invocations
+sqs_client = None
+_sqs_client_lock = threading.Lock()
+
+# Worker pool for SQS sends, kept alive across warm invocations so threads
+# are not recreated on every call
+_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='sqs')
+atexit.register(_EXECUTOR.shutdown, wait=False)
+logger.info("Initialized SQS sender", extra={"max_workers": MAX_WORKERS})
 
 # Queue URL mappings from environment variables
 QUEUE_MAPPINGS = {
@@ -29,28 +79,58 @@ QUEUE_MAPPINGS = {
     'MEDIUM': os.environ['MEDIUM_QUEUE_URL'],
     'LARGE': os.environ['LARGE_QUEUE_URL']
 }
+_VALID_QUEUE_TYPES = frozenset(QUEUE_MAPPINGS)
 
-# Performance configuration
-MAX_WORKERS = 10  # Concurrent SQS operations
-BATCH_SIZE = 10   # SQS batch send size
+# queueType message attributes only take a handful of values, so build them
+# once and share them across entries (botocore only reads them)
+_QUEUE_TYPE_ATTRIBUTES = {
+    queue_type: {'StringValue': queue_type, 'DataType': 'String'}
+    for queue_type in QUEUE_MAPPINGS
+}
+_UNKNOWN_QUEUE_TYPE_ATTRIBUTE = {'StringValue': 'UNKNOWN', 'DataType': 'String'}
+
+# Application count thresholds (inclusive upper bounds)
+SMALL_MAX_APPLICATIONS = 50
+MEDIUM_MAX_APPLICATIONS = 200
+
+
+def get_sqs_client() -> Any:
+    """
+    Return the shared SQS client, creating it on first use.
+    
+    Creation is deferred so cold starts that see no routable messages never
+    pay for it, and is locked because boto3 client creation is not
+    thread-safe and the first sends happen on executor threads.
+    
+    Returns:
+        boto3 SQS client
+    """
+    global sqs_client
+    if sqs_client is None:
+        with _sqs_client_lock:
+            if sqs_client is None:
+                sqs_client = boto3.client('sqs', config=SQS_CLIENT_CONFIG)
+    return sqs_client
 
 
 class RouterMetrics:
     """Centralized metrics tracking for the router."""
     
     @staticmethod
-    def record_message_processed(queue_type: str):
-        metrics.add_metric(name="MessagesProcessed", unit=MetricUnit.Count, value=1)
-        metrics.add_metadata(key="queue_type", value=queue_type)
+    def record_messages_processed(queue_counts: Dict[str, int]) -> None:
+        metrics.add_metric(name="MessagesProcessed", unit=MetricUnit.Count, value=sum(queue_counts.values()))
+        for queue_type, count in queue_counts.items():
+            metrics.add_metric(name=f"{queue_type.title()}MessagesProcessed", unit=MetricUnit.Count, value=count)
     
     @staticmethod
-    def record_routing_error(error_type: str):
+    def record_routing_error(error_type: str) -> None:
         metrics.add_metric(name="RoutingErrors", unit=MetricUnit.Count, value=1)
         metrics.add_metadata(key="error_type", value=error_type)
     
     @staticmethod
-    def record_batch_size(size: int):
-        metrics.add_metric(name="BatchSize", unit=MetricUnit.Count, value=size)
+    def record_batches_sent(batch_count: int, message_count: int) -> None:
+        metrics.add_metric(name="BatchesSent", unit=MetricUnit.Count, value=batch_count)
+        metrics.add_metric(name="MessagesSent", unit=MetricUnit.Count, value=message_count)
 
 
 def parse_kafka_message(record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -63,33 +143,32 @@ def parse_kafka_message(record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     Returns:
         Parsed message data or None if parsing fails
     """
+    encoded_value = record.get('value', '')
+    if not encoded_value:
+        logger.warning("Empty message value in record", extra={
+            "topic": record.get('topic'),
+            "partition": record.get('partition'),
+            "offset": record.get('offset')
+        })
+        return None
+    
     try:
-        # Decode base64 encoded message value
-        encoded_value = record.get('value', '')
-        if not encoded_value:
-            logger.warning("Empty message value in record", extra={"record": record})
-            return None
-            
-        # Decode from base64
-        decoded_bytes = base64.b64decode(encoded_value)
-        message_str = decoded_bytes.decode('utf-8')
-        
-        # Parse JSON
-        message_data = json.loads(message_str)
-        
-        logger.debug("Parsed message", extra={"message": message_data})
-        return message_data
-        
-    except Exception as e:
+        # Decode base64 and parse JSON straight from the bytes (no intermediate str)
+        message_data = _json_loads(_b64decode(encoded_value))
+    except (TypeError, ValueError) as e:
         logger.error("Failed to parse Kafka message", extra={
             "error": str(e),
-            "record": record
+            "topic": record.get('topic'),
+            "partition": record.get('partition'),
+            "offset": record.get('offset')
         })
         RouterMetrics.record_routing_error("parse_error")
         return None
+    
+    return message_data
 
 
-def determine_queue_type(message: Dict[str, Any]) -> Optional[str]:
+def determine_queue_type(message: Dict[str, Any]) -> str:
     """
     Determine target queue type from message metadata.
     
@@ -97,22 +176,21 @@ def determine_queue_type(message: Dict[str, Any]) -> Optional[str]:
         message: Parsed message data
         
     Returns:
-        Queue type (SMALL, MEDIUM, LARGE) or None if undetermined
+        Queue type (SMALL, MEDIUM, LARGE)
     """
     # First, check if ProductApplicationsCountTransform already set queueType
     queue_type = message.get('queueType')
-    if queue_type and queue_type in QUEUE_MAPPINGS:
+    if isinstance(queue_type, str) and queue_type in _VALID_QUEUE_TYPES:
         return queue_type
     
     # Fallback: determine from applicationCount if queueType is missing
-    app_count = message.get('applicationCount', message.get('NumberOfApplications', 0))
+    app_count = message.get('applicationCount')
+    if app_count is None:
+        app_count = message.get('NumberOfApplications', 0)
     
-    if app_count <= 50:
+    if app_count <= SMALL_MAX_APPLICATIONS:
         return 'SMALL'
-    elif app_count <= 200:
-        return 'MEDIUM'
-    else:
-        return 'LARGE'
+    return 'MEDIUM' if app_count <= MEDIUM_MAX_APPLICATIONS else 'LARGE'
 
 
 def send_to_sqs_batch(messages: List[Dict[str, Any]], queue_url: str) -> bool:
@@ -127,29 +205,49 @@ def send_to_sqs_batch(messages: List[Dict[str, Any]], queue_url: str) -> bool:
         True if all messages sent successfully, False otherwise
     """
     try:
-        # Prepare batch entries
-        entries = []
-        for i, message in enumerate(messages):
-            entries.append({
-                'Id': str(i),
-                'MessageBody': json.dumps(message),
-                'MessageAttributes': {
-                    'queueType': {
-                        'StringValue': message.get('queueType', 'UNKNOWN'),
-                        'DataType': 'String'
-                    },
-                    'productId': {
-                        'StringValue': str(message.get('productId', 'unknown')),
-                        'DataType': 'String'
+        # Prepare batch entries (locals avoid per-message global lookups)
+        dumps = _json_dumps
+        if EMIT_MESSAGE_ATTRS:
+            queue_type_attrs = _QUEUE_TYPE_ATTRIBUTES
+            unknown_queue_type_attr = _UNKNOWN_QUEUE_TYPE_ATTRIBUTE
+            entries = [
+                {
+                    'Id': str(i),
+                    'MessageBody': dumps(message),
+                    'MessageAttributes': {
+                        'queueType': queue_type_attrs.get(message.get('queueType', 'UNKNOWN'), unknown_queue_type_attr),
+                        'productId': {
+                            'StringValue': str(message.get('productId', 'unknown')),
+                            'DataType': 'String'
+                        }
                     }
                 }
-            })
+                for i, message in enumerate(messages)
+            ]
+        else:
+            entries = [
+                {'Id': str(i), 'MessageBody': dumps(message)}
+                for i, message in enumerate(messages)
+            ]
+        
+        client = get_sqs_client()
         
-        # Send batch to SQS
-        response = sqs_client.send_message_batch(
-            QueueUrl=queue_url,
-            Entries=entries
-        )
+        # A single message goes through SendMessage, which raises on failure
+        # and avoids the batch API's per-entry Successful/Failed response
+        if len(entries) == 1:
+            entry = entries[0]
+            client.send_message(
+                QueueUrl=queue_url,
+                MessageBody=entry['MessageBody'],
+                MessageAttributes=entry.get('MessageAttributes', {})
+            )
+            response = {}
+        else:
+            # Send batch to SQS
+            response = client.send_message_batch(
+                QueueUrl=queue_url,
+                Entries=entries
+            )
         
         # Check for failures
         if 'Failed' in response and response['Failed']:
@@ -176,6 +274,13 @@ def send_to_sqs_batch(messages: List[Dict[str, Any]], queue_url: str) -> bool:
         return False
 
 
+# Per-queue-type senders with the queue URL bound at import
+_SENDERS = {
+    queue_type: partial(send_to_sqs_batch, queue_url=queue_url)
+    for queue_type, queue_url in QUEUE_MAPPINGS.items()
+}
+
+
 def route_messages_by_queue_type(parsed_messages: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
     """
     Group messages by their target queue type.
@@ -184,68 +289,89 @@ def route_messages_by_queue_type(parsed_messages: List[Dict[str, Any]]) -> Dict[
         parsed_messages: List of parsed message data
         
     Returns:
-        Dictionary mapping queue types to their messages
+        Dictionary mapping each queue type that received messages to its messages
     """
-    grouped_messages = {'SMALL': [], 'MEDIUM': [], 'LARGE': []}
+    grouped_messages: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
     
     for message in parsed_messages:
-        queue_type = determine_queue_type(message)
-        if queue_type and queue_type in grouped_messages:
-            # Ensure queueType is set in message for downstream processing
-            message['queueType'] = queue_type
-            grouped_messages[queue_type].append(message)
-            RouterMetrics.record_message_processed(queue_type)
-        else:
-            logger.warning("Unable to determine queue type", extra={"message": message})
-            RouterMetrics.record_routing_error("undetermined_queue_type")
+        route_message(message, grouped_messages)
     
-    return grouped_messages
+    RouterMetrics.record_messages_processed({
+        queue_type: len(messages) for queue_type, messages in grouped_messages.items()
+    })
+    return dict(grouped_messages)
 
 
-def send_batches_concurrently(grouped_messages: Dict[str, List[Dict[str, Any]]]) -> bool:
+def route_message(message: Dict[str, Any], grouped_messages: Dict[str, List[Dict[str, Any]]]) -> bool:
     """
-    Send message batches to SQS queues concurrently for optimal performance.
+    Append a single message to the bucket for its target queue type.
     
     Args:
-        grouped_messages: Messages grouped by queue type
+        message: Parsed message data
+        grouped_messages: Queue type buckets (a defaultdict(list)) to append to
         
     Returns:
-        True if all batches sent successfully, False otherwise
+        True if the message was routed, False if its queue type is undetermined
     """
-    all_successful = True
+    queue_type = determine_queue_type(message)
+    if queue_type in _VALID_QUEUE_TYPES:
+        # Ensure queueType is set in message for downstream processing
+        message['queueType'] = queue_type
+        grouped_messages[queue_type].append(message)
+        return True
     
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = []
+    logger.warning("Unable to determine queue type", extra={"parsed_message": message})
+    RouterMetrics.record_routing_error("undetermined_queue_type")
+    return False
+
+
+def submit_batch(batch: List[Dict[str, Any]], queue_type: str) -> Tuple["Future[bool]", str, int]:
+    """
+    Submit a single SQS batch send to the shared executor.
+    
+    Args:
+        batch: Messages to send (at most BATCH_SIZE)
+        queue_type: Target queue type
         
-        for queue_type, messages in grouped_messages.items():
-            if not messages:
-                continue
-                
-            queue_url = QUEUE_MAPPINGS[queue_type]
-            
-            # Split into batches of BATCH_SIZE (SQS limit is 10 messages per batch)
-            for i in range(0, len(messages), BATCH_SIZE):
-                batch = messages[i:i + BATCH_SIZE]
-                future = executor.submit(send_to_sqs_batch, batch, queue_url)
-                futures.append((future, queue_type, len(batch)))
+    Returns:
+        Tuple of (future, queue type, batch size) for collect_batch_results
+    """
+    future = _EXECUTOR.submit(_SENDERS[queue_type], batch)
+    return future, queue_type, len(batch)
+
+
+def collect_batch_results(futures: List[Tuple["Future[bool]", str, int]]) -> bool:
+    """
+    Wait for submitted SQS batch sends and record their outcome.
+    
+    Args:
+        futures: Pending sends as returned by submit_batch
         
-        # Wait for all batches to complete
-        for future, queue_type, batch_size in futures:
-            try:
-                success = future.result(timeout=30)  # 30 second timeout per batch
-                if not success:
-                    all_successful = False
-                else:
-                    RouterMetrics.record_batch_size(batch_size)
-            except Exception as e:
-                logger.error("Batch send failed", extra={
-                    "error": str(e),
-                    "queue_type": queue_type,
-                    "batch_size": batch_size
-                })
+    Returns:
+        True if all batches sent successfully, False otherwise
+    """
+    all_successful = True
+    sent_batches = 0
+    sent_messages = 0
+    
+    for future, queue_type, batch_size in futures:
+        try:
+            success = future.result(timeout=30)  # 30 second timeout per batch
+            if not success:
                 all_successful = False
-                RouterMetrics.record_routing_error("concurrent_send_error")
+            else:
+                sent_batches += 1
+                sent_messages += batch_size
+        except Exception as e:
+            logger.error("Batch send failed", extra={
+                "error": str(e),
+                "queue_type": queue_type,
+                "batch_size": batch_size
+            })
+            all_successful = False
+            RouterMetrics.record_routing_error("concurrent_send_error")
     
+    RouterMetrics.record_batches_sent(sent_batches, sent_messages)
     return all_successful
 
 
@@ -263,56 +389,75 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     Returns:
         Response indicating processing status
     """
+    # Sends already handed to the executor; drained even if the handler fails,
+    # since Lambda freezes the environment as soon as the handler returns
+    futures: List[Tuple["Future[bool]", str, int]] = []
+    
     try:
         logger.info("Processing MSK event", extra={
             "event_source": event.get('eventSource'),
             "record_count": len(event.get('records', {}))
         })
         
-        # Parse all Kafka messages from the event
-        parsed_messages = []
+        # Parse and route each Kafka message, dispatching full batches to SQS
+        # as soon as they fill so sends overlap with parsing
+        pending_batches: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        queue_counts: Dict[str, int] = defaultdict(int)
+        parsed_count = 0
         total_records = 0
+        debug_enabled = logger.log_level <= logging.DEBUG
         
         for topic_partition, records in event.get('records', {}).items():
             total_records += len(records)
-            logger.debug("Processing partition", extra={
-                "topic_partition": topic_partition,
-                "record_count": len(records)
-            })
+            if debug_enabled:
+                logger.debug("Processing partition", extra={
+                    "topic_partition": topic_partition,
+                    "record_count": len(records)
+                })
             
             for record in records:
                 parsed_message = parse_kafka_message(record)
-                if parsed_message:
-                    parsed_messages.append(parsed_message)
+                if not parsed_message:
+                    continue
+                if debug_enabled:
+                    logger.debug("Parsed message", extra={"parsed_message": parsed_message})
+                parsed_count += 1
+                if not route_message(parsed_message, pending_batches):
+                    continue
+                
+                queue_type = parsed_message['queueType']
+                queue_counts[queue_type] += 1
+                if len(pending_batches[queue_type]) >= BATCH_SIZE:
+                    futures.append(submit_batch(pending_batches.pop(queue_type), queue_type))
         
-        logger.info("Parsed messages from MSK", extra={
+        logger.info("Parsed and grouped messages from MSK", extra={
             "total_records": total_records,
-            "parsed_messages": len(parsed_messages)
+            "parsed_messages": parsed_count,
+            "small_count": queue_counts.get('SMALL', 0),
+            "medium_count": queue_counts.get('MEDIUM', 0),
+            "large_count": queue_counts.get('LARGE', 0)
         })
         
-        if not parsed_messages:
+        if not parsed_count:
             logger.warning("No valid messages to process")
             return {"statusCode": 200, "processedMessages": 0}
         
-        # Group messages by target queue type
-        grouped_messages = route_messages_by_queue_type(parsed_messages)
+        RouterMetrics.record_messages_processed(queue_counts)
         
-        logger.info("Grouped messages by queue type", extra={
-            "small_count": len(grouped_messages['SMALL']),
-            "medium_count": len(grouped_messages['MEDIUM']),
-            "large_count": len(grouped_messages['LARGE'])
-        })
+        # Flush partially filled batches and wait for all sends to finish
+        for queue_type, batch in pending_batches.items():
+            futures.append(submit_batch(batch, queue_type))
         
-        # Send messages to SQS queues concurrently
-        success = send_batches_concurrently(grouped_messages)
+        success = collect_batch_results(futures)
+        futures = []
         
         response = {
             "statusCode": 200 if success else 500,
-            "processedMessages": len(parsed_messages),
+            "processedMessages": parsed_count,
             "queueDistribution": {
-                "small": len(grouped_messages['SMALL']),
-                "medium": len(grouped_messages['MEDIUM']),
-                "large": len(grouped_messages['LARGE'])
+                "small": queue_counts.get('SMALL', 0),
+                "medium": queue_counts.get('MEDIUM', 0),
+                "large": queue_counts.get('LARGE', 0)
             }
         }
         
@@ -322,6 +467,8 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     except Exception as e:
         logger.error("Lambda handler error", extra={"error": str(e)})
         RouterMetrics.record_routing_error("handler_error")
+        if futures:
+            collect_batch_results(futures)
         return {
             "statusCode": 500,
             "error": str(e)
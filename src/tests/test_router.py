@@ -4,12 +4,20 @@ Unit tests for the topic queue router Lambda function.
 
 import json
 import base64
+import logging
+import time
 import pytest
+from concurrent.futures import Future
 from unittest.mock import Mock, patch, MagicMock
+import router
 from router import (
     parse_kafka_message,
     determine_queue_type,
     route_messages_by_queue_type,
+    route_message,
+    send_to_sqs_batch,
+    get_sqs_client,
+    collect_batch_results,
     lambda_handler
 )
 
@@ -41,6 +49,14 @@ class TestParseKafkaMessage:
         
         assert result is None
 
+    def test_parse_invalid_base64(self):
+        """Test parsing a value that is not valid base64."""
+        record = {"value": "abc"}  # incorrect padding
+        
+        result = parse_kafka_message(record)
+        
+        assert result is None
+
 
 class TestDetermineQueueType:
     def test_existing_queue_type(self):
@@ -81,6 +97,22 @@ class TestDetermineQueueType:
         assert determine_queue_type({"applicationCount": 200}) == "MEDIUM"
         assert determine_queue_type({"applicationCount": 201}) == "LARGE"
 
+    def test_number_of_applications_fallback(self):
+        """Test fallback to NumberOfApplications when applicationCount is missing."""
+        assert determine_queue_type({"NumberOfApplications": 150}) == "MEDIUM"
+        assert determine_queue_type({"applicationCount": 10, "NumberOfApplications": 500}) == "SMALL"
+
+    def test_non_string_queue_type_falls_back_to_count(self):
+        """Test that a non-string (even unhashable) queueType is ignored."""
+        assert determine_queue_type({"queueType": [], "applicationCount": 5}) == "SMALL"
+        assert determine_queue_type({"queueType": {"t": "LARGE"}, "applicationCount": 100}) == "MEDIUM"
+
+    def test_unknown_queue_type_falls_back_to_count(self):
+        """Test that an unrecognized queueType is ignored."""
+        message = {"queueType": "HUGE", "applicationCount": 300}
+        
+        assert determine_queue_type(message) == "LARGE"
+
 
 class TestRouteMessagesByQueueType:
     def test_route_mixed_messages(self):
@@ -100,6 +132,117 @@ class TestRouteMessagesByQueueType:
         assert result["MEDIUM"][0]["queueType"] == "MEDIUM"
         assert result["LARGE"][0]["queueType"] == "LARGE"
 
+    def test_route_only_materializes_seen_queue_types(self):
+        """Test that buckets are only created for queue types that received messages."""
+        result = route_messages_by_queue_type([{"applicationCount": 25}])
+        
+        assert list(result) == ["SMALL"]
+        assert isinstance(result, dict)
+
+    @patch('router.metrics')
+    def test_route_records_aggregated_metrics(self, mock_metrics):
+        """Test that processed-message metrics are emitted once per queue type."""
+        messages = [{"applicationCount": 10}, {"applicationCount": 20}, {"applicationCount": 300}]
+        
+        route_messages_by_queue_type(messages)
+        
+        values = {c.kwargs["name"]: c.kwargs["value"] for c in mock_metrics.add_metric.call_args_list}
+        assert values == {
+            "MessagesProcessed": 3,
+            "SmallMessagesProcessed": 2,
+            "LargeMessagesProcessed": 1
+        }
+
+    def test_route_single_message(self):
+        """Test routing a single message into existing buckets."""
+        grouped = {"SMALL": [], "MEDIUM": [], "LARGE": []}
+        message = {"productId": 1, "applicationCount": 100}
+        
+        assert route_message(message, grouped) is True
+        assert grouped["MEDIUM"] == [message]
+        assert message["queueType"] == "MEDIUM"
+
+
+class TestGetSqsClient:
+    @patch('router.sqs_client', None)
+    @patch('router.boto3')
+    def test_client_created_once(self, mock_boto3):
+        """Test that the SQS client is created lazily and reused."""
+        first = get_sqs_client()
+        second = get_sqs_client()
+        
+        assert first is second
+        mock_boto3.client.assert_called_once()
+
+
+class TestSendToSqsBatch:
+    QUEUE_URL = 'https://sqs.us-west-2.amazonaws.com/123456789/dev-small-products-queue'
+
+    @patch('router.sqs_client')
+    def test_send_without_message_attributes(self, mock_sqs_client):
+        """Test that message attributes are omitted by default."""
+        mock_sqs_client.send_message_batch.return_value = {'Failed': []}
+        messages = [{"productId": 1, "queueType": "SMALL"}, {"productId": 2, "queueType": "SMALL"}]
+        
+        assert send_to_sqs_batch(messages, self.QUEUE_URL) is True
+        
+        entries = mock_sqs_client.send_message_batch.call_args.kwargs["Entries"]
+        assert [entry["Id"] for entry in entries] == ["0", "1"]
+        assert json.loads(entries[0]["MessageBody"]) == messages[0]
+        assert all("MessageAttributes" not in entry for entry in entries)
+
+    @patch('router.EMIT_MESSAGE_ATTRS', True)
+    @patch('router.sqs_client')
+    def test_send_with_message_attributes(self, mock_sqs_client):
+        """Test that message attributes are attached when enabled."""
+        mock_sqs_client.send_message_batch.return_value = {'Failed': []}
+        messages = [{"productId": 1, "queueType": "SMALL"}, {"productId": 2, "queueType": "SMALL"}]
+        
+        assert send_to_sqs_batch(messages, self.QUEUE_URL) is True
+        
+        attributes = mock_sqs_client.send_message_batch.call_args.kwargs["Entries"][0]["MessageAttributes"]
+        assert attributes["queueType"] == {"StringValue": "SMALL", "DataType": "String"}
+        assert attributes["productId"] == {"StringValue": "1", "DataType": "String"}
+
+    @patch('router.sqs_client')
+    def test_send_single_message(self, mock_sqs_client):
+        """Test that a single message is sent with SendMessage."""
+        message = {"productId": 1, "queueType": "SMALL"}
+        
+        assert send_to_sqs_batch([message], self.QUEUE_URL) is True
+        
+        mock_sqs_client.send_message_batch.assert_not_called()
+        kwargs = mock_sqs_client.send_message.call_args.kwargs
+        assert kwargs["QueueUrl"] == self.QUEUE_URL
+        assert json.loads(kwargs["MessageBody"]) == message
+        assert kwargs["MessageAttributes"] == {}
+
+    @patch('router.sqs_client')
+    def test_send_reports_failures(self, mock_sqs_client):
+        """Test that partial batch failures are reported."""
+        mock_sqs_client.send_message_batch.return_value = {'Failed': [{'Id': '0'}]}
+        messages = [{"productId": 1, "queueType": "SMALL"}, {"productId": 2, "queueType": "SMALL"}]
+        
+        assert send_to_sqs_batch(messages, self.QUEUE_URL) is False
+
+
+class TestCollectBatchResults:
+    @patch('router.metrics')
+    def test_records_sent_totals(self, mock_metrics):
+        """Test that sent batches and messages are emitted as integer totals."""
+        futures = []
+        for success, size in [(True, 10), (True, 3), (False, 10)]:
+            future = Future()
+            future.set_result(success)
+            futures.append((future, "SMALL", size))
+        
+        assert collect_batch_results(futures) is False
+        
+        values = {c.kwargs["name"]: c.kwargs["value"] for c in mock_metrics.add_metric.call_args_list}
+        assert values["BatchesSent"] == 2
+        assert values["MessagesSent"] == 13
+        assert "BatchSize" not in values
+
 
 class TestLambdaHandler:
     @patch.dict('os.environ', {
@@ -132,6 +275,77 @@ class TestLambdaHandler:
         assert result["processedMessages"] == 1
         assert result["queueDistribution"]["medium"] == 1
 
+    @patch.dict('os.environ', {
+        'SMALL_QUEUE_URL': 'https://sqs.us-west-2.amazonaws.com/123456789/dev-small-products-queue',
+        'MEDIUM_QUEUE_URL': 'https://sqs.us-west-2.amazonaws.com/123456789/dev-medium-products-queue',
+        'LARGE_QUEUE_URL': 'https://sqs.us-west-2.amazonaws.com/123456789/dev-large-products-queue'
+    })
+    @patch('router.sqs_client')
+    def test_lambda_handler_dispatches_full_batches(self, mock_sqs_client):
+        """Test that records are split into SQS batches of at most BATCH_SIZE."""
+        mock_sqs_client.send_message_batch.return_value = {'Failed': []}
+        
+        records = [
+            {"value": base64.b64encode(json.dumps({"productId": i, "applicationCount": 75}).encode()).decode()}
+            for i in range(25)
+        ]
+        event = {"records": {"product-applications-updates-dev-0": records}}
+        
+        result = lambda_handler(event, Mock())
+        
+        assert result["statusCode"] == 200
+        assert result["processedMessages"] == 25
+        assert result["queueDistribution"]["medium"] == 25
+        batch_sizes = sorted(
+            len(call.kwargs["Entries"]) for call in mock_sqs_client.send_message_batch.call_args_list
+        )
+        assert batch_sizes == [5, 10, 10]
+
+    @patch.dict('os.environ', {
+        'SMALL_QUEUE_URL': 'https://sqs.us-west-2.amazonaws.com/123456789/dev-small-products-queue',
+        'MEDIUM_QUEUE_URL': 'https://sqs.us-west-2.amazonaws.com/123456789/dev-medium-products-queue',
+        'LARGE_QUEUE_URL': 'https://sqs.us-west-2.amazonaws.com/123456789/dev-large-products-queue'
+    })
+    @patch('router.sqs_client')
+    def test_lambda_handler_error_waits_for_submitted_batches(self, mock_sqs_client):
+        """Test that batches submitted before a handler error finish before it returns."""
+        completed = []
+        
+        def slow_send(**kwargs):
+            time.sleep(0.2)
+            completed.append(len(kwargs["Entries"]))
+            return {'Failed': []}
+        mock_sqs_client.send_message_batch.side_effect = slow_send
+        
+        records = [
+            {"value": base64.b64encode(json.dumps({"productId": i, "applicationCount": 75}).encode()).decode()}
+            for i in range(10)
+        ]
+        records.append({"value": base64.b64encode(json.dumps({"productId": 10, "applicationCount": "x"}).encode()).decode()})
+        event = {"records": {"product-applications-updates-dev-0": records}}
+        
+        result = lambda_handler(event, Mock())
+        
+        assert result["statusCode"] == 500
+        assert completed == [10]
+
+    @patch('router.sqs_client')
+    def test_lambda_handler_debug_logging(self, mock_sqs_client):
+        """Test that the handler routes messages with DEBUG logging enabled."""
+        message_data = {"productId": 123, "applicationCount": 75}
+        encoded_message = base64.b64encode(json.dumps(message_data).encode()).decode()
+        event = {"records": {"product-applications-updates-dev-0": [{"value": encoded_message}]}}
+        
+        previous_level = router.logger.log_level
+        router.logger.setLevel(logging.DEBUG)
+        try:
+            result = lambda_handler(event, Mock())
+        finally:
+            router.logger.setLevel(previous_level)
+        
+        assert result["statusCode"] == 200
+        assert result["queueDistribution"]["medium"] == 1
+
     @patch.dict('os.environ', {
         'SMALL_QUEUE_URL': 'https://sqs.us-west-2.amazonaws.com/123456789/dev-small-products-queue',
         'MEDIUM_QUEUE_URL': 'https://sqs.us-west-2.amazonaws.com/123456789/dev-medium-products-queue',